@@ -1,22 +1,51 @@
 import os
 import sys
 import argparse
+import hashlib
+import io
+import linecache
+import mmap
+import tempfile
 import traceback
+import types
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from pathlib import Path
-from typing import TypedDict, Annotated, Literal
+from typing import TypedDict, Annotated, Literal, Optional
 from dotenv import load_dotenv
 
+import numpy as np
 import pandas as pd
 import pdfplumber
 import google.generativeai as genai
 from langgraph.graph import StateGraph, END
 
+from compare import normalize
+
 # Load environment variables
 load_dotenv()
 
 # Configure Gemini API
 genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-flash')
+MODEL_NAME = 'gemini-2.5-flash'
+model = genai.GenerativeModel(MODEL_NAME)
+
+# On-disk cache for LLM responses that produced a passing parser, keyed by SHA-256
+# of the model name and full prompt. Set BANKPARSER_NO_CACHE=1 (or pass --no-cache) to always call the model.
+CACHE_DIR = Path.home() / ".cache" / "bankparser_agent"
+
+# Fixed schema of the ICICI-style expected-output CSVs, so read_csv can skip type inference.
+# Amounts stay float64: float32 cannot represent larger balances to the paisa.
+EXPECTED_DTYPES = {
+    'Date': 'string',
+    'Description': 'string',
+    'Debit Amt': 'float64',
+    'Credit Amt': 'float64',
+    'Balance': 'float64',
+}
+
+# Appended to the retry feedback when the LLM returns code it already produced
+DUPLICATE_CODE_NOTE = "\nDO NOT repeat prior code; produce a DIFFERENT approach."
 
 
 class AgentState(TypedDict):
@@ -26,7 +55,11 @@ class AgentState(TypedDict):
     csv_path: str
     parser_path: str
     pdf_analysis: str
+    pdf_full_context: str
+    expected_df: Optional[pd.DataFrame]
+    last_prompt: str
     generated_code: str
+    tried_hashes: set
     test_result: dict
     error_message: str
     iteration: int
@@ -34,55 +67,97 @@ class AgentState(TypedDict):
     status: Literal["planning", "generating", "testing", "fixing", "success", "failed"]
 
 
-def analyze_pdf(state: AgentState) -> AgentState:
-    """Analyze PDF structure and extract sample data"""
-    print(f"\n📊 [Step 1/4] Analyzing PDF structure for {state['target_bank']}...")
-    
-    try:
-        pdf_path = state['pdf_path']
-        
-        # Extract text and tables from PDF
-        with pdfplumber.open(pdf_path) as pdf:
+def _read_expected_csv(csv_path: str) -> pd.DataFrame:
+    """Load the expected output CSV, using the fixed statement schema when it applies"""
+    # Other banks' CSVs may use different columns or amount formats ("1,000.00", "-"),
+    # so only force the schema on a matching header and fall back to inference otherwise
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    if header == list(EXPECTED_DTYPES):
+        try:
+            return pd.read_csv(csv_path, dtype=EXPECTED_DTYPES, engine='c')
+        except ValueError:
+            pass
+    return pd.read_csv(csv_path)
+
+
+def _extract_pdf_sample(pdf_path: str, max_pages: int = 3, text_chars: int = 500) -> tuple:
+    """Extract text and table samples from the first pages of a PDF"""
+    # Memory-map the file so only the bytes needed for the sampled pages are paged in.
+    # The mmap is handed to pdfplumber directly (wrapping it in BytesIO would copy it).
+    with open(pdf_path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        with pdfplumber.open(mm) as pdf:
             full_text = ""
             tables_info = []
             
-            for page_num, page in enumerate(pdf.pages[:3], 1):  # Analyze first 3 pages
-                full_text += f"\n=== Page {page_num} ===\n"
-                full_text += page.extract_text() or ""
+            for page_num, page in enumerate(pdf.pages[:max_pages], 1):
+                # Only the first `text_chars` characters are used, so later pages
+                # skip text extraction once enough has been collected
+                if len(full_text) < text_chars:
+                    full_text += f"\n=== Page {page_num} ===\n"
+                    full_text += page.extract_text() or ""
                 
-                # Extract tables
-                tables = page.extract_tables()
+                # Locate tables; cell text is only extracted for the first sample table
+                tables = page.find_tables()
                 if tables:
                     tables_info.append({
                         'page': page_num,
                         'table_count': len(tables),
-                        'sample_table': tables[0][:5] if tables else None  # First 5 rows
+                        'sample_table': None if tables_info else tables[0].extract()[:5]  # First 5 rows
                     })
+    
+    return full_text, tables_info
+
+
+def analyze_pdf(state: AgentState) -> AgentState:
+    """Analyze PDF structure and extract sample data"""
+    print(f"\n📊 [Step 1/4] Analyzing PDF structure for {state['target_bank']}...")
+    
+    try:
+        # PDF extraction and CSV schema load are independent, so run them concurrently
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            pdf_future = executor.submit(_extract_pdf_sample, state['pdf_path'])
+            csv_future = executor.submit(_read_expected_csv, state['csv_path'])
+            full_text, tables_info = pdf_future.result()
+            csv_df = csv_future.result()
         
-        # Load expected CSV to understand schema
-        csv_df = pd.read_csv(state['csv_path'])
         expected_columns = csv_df.columns.tolist()
-        sample_rows = csv_df.head(5).to_dict('records')
+        sample_table = tables_info[0]['sample_table'] if tables_info else None
+        if not tables_info:
+            table_shape = "No tables found"
+        elif sample_table:
+            table_shape = f"{len(sample_table[0])} columns, header {sample_table[0]}"
+        else:
+            table_shape = "First table extracted no rows"
         
-        analysis = f"""
-PDF Analysis for {state['target_bank']} Bank Statement:
-
-Expected Output Schema:
-Columns: {expected_columns}
-Sample Expected Output:
-{pd.DataFrame(sample_rows).to_string()}
-
-PDF Content Sample (first 500 chars):
-{full_text[:500]}
-
-Tables Found: {len(tables_info)} tables in first 3 pages
-Sample Table Structure:
-{tables_info[0]['sample_table'] if tables_info else 'No tables found'}
-
-Total Expected Rows: {len(csv_df)}
-"""
+        # Compact fingerprint sent with every prompt (kept small and stable so it
+        # forms a cacheable prompt prefix across retries)
+        buf = io.StringIO()
+        print(file=buf)
+        print(f"PDF Analysis for {state['target_bank']} Bank Statement:", file=buf)
+        print(f"Expected Columns: {expected_columns}", file=buf)
+        print("Sample Expected Rows:", file=buf)
+        print(csv_df.head(2).to_string(), file=buf)
+        print(f"Table Shape: {table_shape} ({len(tables_info)} tables in first 3 pages)", file=buf)
+        print(f"Total Expected Rows: {len(csv_df)}", file=buf)
+        analysis = buf.getvalue()
+        
+        # Fuller context, only sent on the first attempt
+        buf = io.StringIO()
+        print(file=buf)
+        # Rows 0-1 are already in the fingerprint above, so continue from row 2
+        print("More Expected Output Rows:", file=buf)
+        print(csv_df.iloc[2:5].to_string(), file=buf)
+        print(file=buf)
+        print("PDF Content Sample (first 500 chars):", file=buf)
+        print(full_text[:500], file=buf)
+        print(file=buf)
+        print("Sample Table Structure:", file=buf)
+        print(sample_table if sample_table else table_shape, file=buf)
+        full_context = buf.getvalue()
         
         state['pdf_analysis'] = analysis
+        state['pdf_full_context'] = full_context
+        state['expected_df'] = csv_df  # Reused by every test iteration
         state['status'] = "generating"
         print("✅ PDF analysis complete")
         return state
@@ -94,6 +169,50 @@ Total Expected Rows: {len(csv_df)}
         return state
 
 
+def _cache_path(prompt: str) -> Path:
+    """Location of the disk cache entry for a prompt"""
+    key = hashlib.sha256(f"{MODEL_NAME}\0{prompt}".encode('utf-8')).hexdigest()
+    return CACHE_DIR / f"{key}.txt"
+
+
+def cached_generate(prompt: str, use_cache: bool = True) -> str:
+    """Generate text for a prompt, reusing cached responses when allowed"""
+    if not use_cache or os.getenv("BANKPARSER_NO_CACHE") == "1":
+        return model.generate_content(prompt).text
+    return _cached_generate(prompt)
+
+
+@lru_cache(maxsize=None)
+def _cached_generate(prompt: str) -> str:
+    """Look up a response in the disk cache, calling the model on a miss"""
+    cache_path = _cache_path(prompt)
+    if cache_path.exists():
+        return cache_path.read_text(encoding='utf-8')
+    
+    # Responses are only persisted by save_cached_response once their parser passes,
+    # so a failed run is not replayed on the next one
+    return model.generate_content(prompt).text
+
+
+def save_cached_response(prompt: str, text: str) -> None:
+    """Persist a response whose parser passed its tests to the disk cache"""
+    if os.getenv("BANKPARSER_NO_CACHE") == "1":
+        return
+    
+    # Write atomically so an interrupted run never leaves a partial entry.
+    # Caching is best effort: an unwritable cache dir must not fail the run.
+    tmp_path = None
+    try:
+        CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix=".tmp")
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, _cache_path(prompt))
+    except OSError:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
 def generate_parser_code(state: AgentState) -> AgentState:
     """Generate parser code using LLM"""
     iteration_info = f" (Attempt {state['iteration']}/{state['max_iterations']})"
@@ -113,22 +232,26 @@ Requirements:
 
 Return ONLY the complete Python code, no explanations."""
 
+    # Static content (instructions + compact PDF analysis) goes first so repeated
+    # prompts share the longest possible prefix; dynamic feedback goes last.
+    # The full PDF context is only needed on the first attempt.
     if state['error_message'] and state['iteration'] > 1:
-        prompt = f"""Previous attempt failed with error:
-{state['error_message']}
+        prompt = f"""{state['pdf_analysis']}
 
 Previous code:
 ```python
 {state['generated_code']}
 ```
 
-Now generate IMPROVED code that fixes these issues.
+Previous attempt failed with error:
+{state['error_message']}
 
-{state['pdf_analysis']}
+Now generate IMPROVED code that fixes these issues.
 
 Generate the complete parser code:"""
     else:
         prompt = f"""{state['pdf_analysis']}
+{state['pdf_full_context']}
 
 Generate a complete Python parser that:
 1. Opens the PDF using pdfplumber
@@ -140,8 +263,10 @@ Generate the complete parser code:"""
 
     try:
         full_prompt = system_instruction + "\n\n" + prompt
-        response = model.generate_content(full_prompt)
-        code = response.text
+        state['last_prompt'] = full_prompt
+        # After a duplicate the retry prompt can repeat byte for byte, so the cache
+        # would just replay the same code; always ask the model again in that case
+        code = cached_generate(full_prompt, use_cache=DUPLICATE_CODE_NOTE not in state['error_message'])
         
         # Extract code from markdown if present
         if "```python" in code:
@@ -155,6 +280,18 @@ Generate the complete parser code:"""
         if "import pdfplumber" not in code:
             code = "import pdfplumber\n" + code
         
+        # Identical code to an earlier attempt would fail the same way, so skip
+        # testing it and ask for a different approach instead. generated_code is
+        # left as the last tested code so it still matches error_message.
+        code_hash = hashlib.md5(code.encode('utf-8')).hexdigest()
+        if code_hash in state['tried_hashes']:
+            if DUPLICATE_CODE_NOTE not in state['error_message']:
+                state['error_message'] += DUPLICATE_CODE_NOTE
+            state['status'] = "fixing"
+            print("⚠️  Generated code is identical to a previous attempt")
+            return state
+        state['tried_hashes'].add(code_hash)
+        
         state['generated_code'] = code
         state['status'] = "testing"
         print("✅ Parser code generated")
@@ -167,67 +304,78 @@ Generate the complete parser code:"""
         return state
 
 
+def _load_parser_module(code: str) -> types.ModuleType:
+    """Import generated parser code as a fresh module"""
+    # Execute the code in memory; no temp file round-trip is needed. The source is
+    # registered with linecache so tracebacks fed back to the LLM still show code lines.
+    filename = f"<generated-{hashlib.md5(code.encode('utf-8')).hexdigest()[:12]}>"
+    linecache.cache[filename] = (len(code), None, code.splitlines(True), filename)
+    parser_module = types.ModuleType("temp_parser")
+    exec(compile(code, filename, 'exec'), parser_module.__dict__)
+    return parser_module
+
+
 def test_parser(state: AgentState) -> AgentState:
     """Test the generated parser against expected output"""
     print(f"\n🧪 [Step 3/4] Testing generated parser...")
     
     try:
-        # Save the generated code temporarily
-        temp_parser_path = state['parser_path'].replace('.py', '_temp.py')
-        with open(temp_parser_path, 'w') as f:
-            f.write(state['generated_code'])
-        
-        # Import and execute the parser
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("temp_parser", temp_parser_path)
-        parser_module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(parser_module)
+        # Import the parser
+        parser_module = _load_parser_module(state['generated_code'])
         
         # Run the parser
         result_df = parser_module.parse(state['pdf_path'])
         
-        # Load expected output
-        expected_df = pd.read_csv(state['csv_path'])
+        # Load expected output (cached on the state after the first load)
+        expected_df = state.get('expected_df')
+        if expected_df is None:
+            expected_df = _read_expected_csv(state['csv_path'])
+            state['expected_df'] = expected_df
         
-        # Compare results
+        # Compare results (column lists are built once and reused below)
+        r_cols = list(result_df.columns)
+        e_cols = list(expected_df.columns)
         test_result = {
             'passed': False,
             'row_count_match': len(result_df) == len(expected_df),
-            'column_match': list(result_df.columns) == list(expected_df.columns),
+            'column_match': r_cols == e_cols,
             'result_rows': len(result_df),
             'expected_rows': len(expected_df),
-            'result_columns': list(result_df.columns),
-            'expected_columns': list(expected_df.columns)
+            'result_columns': r_cols,
+            'expected_columns': e_cols
         }
         
         # Check if DataFrames are equal
         if test_result['row_count_match'] and test_result['column_match']:
             # Normalize data for comparison
-            result_normalized = result_df.fillna('').astype(str)
-            expected_normalized = expected_df.fillna('').astype(str)
+            result_values = normalize(result_df)
+            expected_values = normalize(expected_df)
+            
+            # Compare values in one vectorized pass and only materialize mismatches
+            mask = result_values != expected_values
+            total_differences = int(np.count_nonzero(mask))
             
-            # Compare values
+            # Only locate the first 10 mismatches; a perfect match skips this entirely
             differences = []
-            for idx in range(min(len(result_normalized), len(expected_normalized))):
-                for col in expected_df.columns:
-                    if col in result_df.columns:
-                        result_val = str(result_normalized.iloc[idx][col]).strip()
-                        expected_val = str(expected_normalized.iloc[idx][col]).strip()
-                        if result_val != expected_val:
-                            differences.append({
-                                'row': idx,
-                                'column': col,
-                                'result': result_val,
-                                'expected': expected_val
-                            })
+            if total_differences:
+                rows, cols_idx = np.divmod(np.flatnonzero(mask)[:10], mask.shape[1])
+                differences = [
+                    {
+                        'row': int(row),
+                        'column': e_cols[col],
+                        'result': result_values[row, col],
+                        'expected': expected_values[row, col]
+                    }
+                    for row, col in zip(rows, cols_idx)
+                ]
             
-            if len(differences) == 0:
+            if total_differences == 0:
                 test_result['passed'] = True
                 test_result['message'] = "✅ Perfect match!"
             else:
-                test_result['differences'] = differences[:10]  # First 10 differences
-                test_result['total_differences'] = len(differences)
-                test_result['message'] = f"❌ Found {len(differences)} differences"
+                test_result['differences'] = differences  # First 10 differences
+                test_result['total_differences'] = total_differences
+                test_result['message'] = f"❌ Found {total_differences} differences"
         else:
             test_result['message'] = "❌ Structure mismatch"
         
@@ -237,6 +385,7 @@ def test_parser(state: AgentState) -> AgentState:
             # Save the successful parser
             with open(state['parser_path'], 'w') as f:
                 f.write(state['generated_code'])
+            save_cached_response(state['last_prompt'], state['generated_code'])
             state['status'] = "success"
             print(f"✅ Tests passed! Parser saved to {state['parser_path']}")
         else:
@@ -255,10 +404,6 @@ def test_parser(state: AgentState) -> AgentState:
             state['error_message'] = error_details
             print(f"❌ Tests failed: {test_result['message']}")
         
-        # Clean up temp file
-        if os.path.exists(temp_parser_path):
-            os.remove(temp_parser_path)
-        
         return state
         
     except Exception as e:
@@ -280,6 +425,15 @@ def should_retry(state: AgentState) -> Literal["retry", "end"]:
         return "retry"
 
 
+def after_generate(state: AgentState) -> Literal["test", "retry", "end"]:
+    """Test new code, retry on a duplicate attempt, or stop if generation failed"""
+    if state['status'] == "failed":
+        return "end"
+    if state['status'] == "fixing":
+        return should_retry(state)
+    return "test"
+
+
 def fix_and_retry(state: AgentState) -> AgentState:
     """Prepare for retry with error context"""
     print(f"\n🔧 [Step 4/4] Analyzing errors and preparing retry...")
@@ -301,7 +455,15 @@ def create_agent_graph():
     # Add edges
     workflow.set_entry_point("analyze")
     workflow.add_edge("analyze", "generate")
-    workflow.add_edge("generate", "test")
+    workflow.add_conditional_edges(
+        "generate",
+        after_generate,
+        {
+            "test": "test",
+            "retry": "fix",
+            "end": END
+        }
+    )
     workflow.add_conditional_edges(
         "test",
         should_retry,
@@ -332,8 +494,15 @@ def main():
         default=3,
         help="Maximum self-correction attempts (default: 3)"
     )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Always call the LLM instead of reusing cached responses"
+    )
     
     args = parser.parse_args()
+    if args.no_cache:
+        os.environ["BANKPARSER_NO_CACHE"] = "1"
     
     # Setup paths
     target_bank = args.target.lower()
@@ -367,7 +536,11 @@ def main():
         csv_path=str(csv_path),
         parser_path=str(parser_path),
         pdf_analysis="",
+        pdf_full_context="",
+        expected_df=None,
+        last_prompt="",
         generated_code="",
+        tried_hashes=set(),
         test_result={},
         error_message="",
         iteration=1,
@@ -0,0 +1,20 @@
+import numpy as np
+import pandas as pd
+
+# Convert a single cell to its comparison form: missing -> '', otherwise stripped str.
+# Non-scalar cells (lists, arrays) are stringified rather than passed to pd.isna,
+# which would return an array and make the truth test ambiguous.
+_normalize_cell = np.vectorize(
+    lambda v: '' if pd.api.types.is_scalar(v) and pd.isna(v) else str(v).strip(),
+    otypes=[object],
+)
+
+
+def normalize(df: pd.DataFrame) -> np.ndarray:
+    """
+    Return a 2D object array of stripped strings for cell-wise comparison.
+
+    Missing values (None, NaN, pd.NA) become empty strings, so parser output and
+    the expected CSV compare equal regardless of how blanks are represented.
+    """
+    return _normalize_cell(df.to_numpy(dtype=object))
@@ -1,7 +1,29 @@
+import os
+
 import pdfplumber
 import pandas as pd
 import numpy as np
 
+# Numba is optional: without it the amount parser runs as plain Python
+try:
+    from numba import njit
+except ImportError:
+    njit = lambda **kwargs: (lambda f: f)
+
+# PyMuPDF is optional: when available its C-backed table finder is used,
+# otherwise tables are extracted with pdfplumber
+try:
+    import fitz
+except ImportError:
+    fitz = None
+
+# ICICI statements are ruled tables, so detect cells from drawn lines only
+TABLE_SETTINGS = {
+    "vertical_strategy": "lines",
+    "horizontal_strategy": "lines",
+    "snap_tolerance": 3,
+}
+
 def parse(pdf_path: str) -> pd.DataFrame:
     """
     Parses a bank statement PDF to extract transaction data into a pandas DataFrame.
@@ -12,64 +34,179 @@ def parse(pdf_path: str) -> pd.DataFrame:
     Returns:
         pd.DataFrame: A DataFrame containing the extracted transaction data with
                       columns: ['Date', 'Description', 'Debit Amt', 'Credit Amt', 'Balance'].
+                      Date and Description are strings as printed in the statement; with
+                      BANKPARSER_FAST=1 they are returned as datetime64[ns] and
+                      string[pyarrow] (or pandas 'string' without pyarrow) instead.
     """
-    all_extracted_rows = []
     header = []
     
     # Define the exact columns expected in the final DataFrame
     expected_columns = ['Date', 'Description', 'Debit Amt', 'Credit Amt', 'Balance']
+    numeric_columns = ['Debit Amt', 'Credit Amt', 'Balance']
 
-    with pdfplumber.open(pdf_path) as pdf:
-        for page in pdf.pages:
-            # Extract all tables found on the current page
-            tables = page.extract_tables()
-            
-            if not tables:
-                continue # No tables found on this page, move to the next page
-
-            # Assuming the first table found on the page contains the primary transaction data
-            current_table = tables[0]
-
-            if not current_table:
-                continue # The extracted table is empty, skip it
-
-            # If the header has not been established yet, set it from the first row of the first valid table
-            if not header:
-                # Clean header names (strip leading/trailing whitespace)
-                header = [h.strip() if h else '' for h in current_table[0]]
-                # Add data rows, skipping the header row as it's now stored separately
-                all_extracted_rows.extend(current_table[1:])
-            else:
-                # For subsequent pages/tables, assume the first row is a repeated header
-                # and skip it to avoid duplicating header rows in the data.
-                # Only append if there are actual data rows present after the potential header.
-                if len(current_table) > 1:
-                    all_extracted_rows.extend(current_table[1:])
+    # Accumulate values column-wise so no intermediate list of rows is kept
+    cols = {c: [] for c in expected_columns}
+    # Position of each expected column within the PDF table header (None if absent)
+    column_positions = {}
+
+    for current_table in _iter_page_tables(pdf_path):
+        if not current_table:
+            continue # The extracted table is empty, skip it
+
+        # If the header has not been established yet, set it from the first row of the first valid table
+        if not header:
+            # Clean header names (strip leading/trailing whitespace)
+            header = [h.strip() if h else '' for h in current_table[0]]
+            column_positions = {
+                c: header.index(c) if c in header else None for c in expected_columns
+            }
+
+        # The first row of every table is either the header or a repeated header
+        # on subsequent pages, so skip it to avoid duplicating header rows in the data.
+        for row in current_table[1:]:
+            for c in expected_columns:
+                pos = column_positions[c]
+                cols[c].append(row[pos] if pos is not None and pos < len(row) else None)
     
     # If no data was extracted after processing all pages (e.g., PDF was empty or malformed),
     # return an empty DataFrame with the correct expected columns.
-    if not all_extracted_rows or not header:
+    if not header or not cols['Date']:
         return pd.DataFrame(columns=expected_columns)
 
-    # Create an initial DataFrame using the extracted rows and the collected header
-    df = pd.DataFrame(all_extracted_rows, columns=header)
-
-    # Ensure the DataFrame has exactly the expected columns, in the specified order.
-    # Columns present in `df` but not in `expected_columns` will be dropped.
-    # Columns in `expected_columns` but not in `df` will be added with NaN values.
-    df = df.reindex(columns=expected_columns)
-
-    # Perform type conversion and data cleaning for numeric columns
-    for col in ['Debit Amt', 'Credit Amt', 'Balance']:
-        if col in df.columns:
-            # Replace various representations of empty or missing values (empty string, space, None)
-            # with numpy's NaN before converting to numeric type. This makes numeric conversion robust.
-            df[col] = df[col].replace(['', ' ', None], np.nan)
-            # Convert the column to a numeric type (float). 'errors='coerce'' will turn any values
-            # that cannot be parsed as a number (e.g., non-numeric strings) into NaN.
-            df[col] = pd.to_numeric(df[col], errors='coerce')
+    # Numeric columns are converted directly to float arrays in a single pass. Empty or missing
+    # values (empty string, space, None) and anything that cannot be parsed become NaN.
+    # float64 is kept deliberately: float32 only holds ~7 significant digits, which would
+    # lose paise on balances of a lakh or more.
+    data = {}
+    for c in expected_columns:
+        if c in numeric_columns:
+            # A 'Dr' marker means an overdrawn (negative) balance; on Debit/Credit columns
+            # the column itself carries the direction, so the marker is just stripped
+            signed = c == 'Balance'
+            values = (_to_float(v, signed) for v in cols[c])
+            data[c] = np.fromiter(values, dtype=np.float64, count=len(cols[c]))
+        else:
+            data[c] = pd.array(cols[c], dtype=object)
     
     # 'Date' and 'Description' columns are typically strings and should retain their original string format
-    # as extracted by pdfplumber. No further specific conversion is needed for these.
+    # as extracted by pdfplumber, since the expected CSV output compares against that text.
+    df = pd.DataFrame(data, columns=expected_columns)
+
+    # Opt-in compact dtypes for large statements: fixed-width datetimes and arrow-backed strings
+    if os.environ.get('BANKPARSER_FAST') == '1':
+        df['Date'] = pd.to_datetime(df['Date'], format='%d-%m-%Y', errors='coerce')
+        try:
+            df['Description'] = df['Description'].astype('string[pyarrow]')
+        except ImportError:
+            df['Description'] = df['Description'].astype('string')
 
     return df
+
+
+def _has_pymupdf_tables() -> bool:
+    """Whether PyMuPDF is installed and new enough to provide Page.find_tables."""
+    # getattr guards against the unrelated PyPI package also named 'fitz'
+    return fitz is not None and hasattr(getattr(fitz, 'Page', None), 'find_tables')
+
+
+def _iter_page_tables(pdf_path: str):
+    """
+    Yield the rows of the first table on each page of the PDF.
+
+    Uses PyMuPDF when it is installed (and new enough to provide find_tables),
+    falling back to pdfplumber otherwise. Pages without tables are skipped.
+    """
+    if _has_pymupdf_tables():
+        with fitz.open(pdf_path) as doc:
+            for page in doc:
+                tables = page.find_tables(**TABLE_SETTINGS).tables
+                if not tables:
+                    continue
+                table = tables[0]
+                # PyMuPDF leaves a header it detects outside the table body out of
+                # extract(); put it back so the first row is always the header, as with pdfplumber
+                if table.header.external:
+                    yield [table.header.names] + table.extract()
+                else:
+                    yield table.extract()
+        return
+
+    # Only tables are needed, so skip pdfminer layout analysis (laparams=None)
+    with pdfplumber.open(pdf_path, laparams=None) as pdf:
+        for page in pdf.pages:
+            # Release each page's cached layout objects once it has been processed,
+            # keeping memory bounded to a single page on long statements
+            try:
+                # Locate tables on the current page without extracting their contents yet
+                tables = page.find_tables(table_settings=TABLE_SETTINGS)
+
+                # The first table found on the page is assumed to hold the transaction data,
+                # so only that table's cell text is extracted
+                if tables:
+                    yield tables[0].extract()
+            finally:
+                page.flush_cache()
+
+
+def _to_float(value, signed: bool = False) -> float:
+    """Convert a raw table cell to float, returning NaN for blank or invalid values."""
+    if value is None:
+        return np.nan
+    return _parse_amount(value, signed)
+
+
+@njit(cache=True)
+def _parse_amount(s: str, signed: bool = False) -> float:
+    """
+    Parse an amount string such as ' 1,935.30 ' or '500.00 Dr' into a float.
+
+    Surrounding whitespace and thousands separators are ignored, and a trailing
+    'Cr'/'Dr' marker is stripped; with `signed` set, 'Dr' makes the value negative.
+    Blank or otherwise unparseable strings (including exponents like '1e5') and
+    values with more than 18 digits return NaN.
+    """
+    start = 0
+    end = len(s)
+    while start < end and ord(s[start]) <= 32:
+        start += 1
+    while end > start and ord(s[end - 1]) <= 32:
+        end -= 1
+
+    sign = 1.0
+    if end - start >= 2 and (ord(s[end - 1]) | 32) == ord('r'):
+        marker = ord(s[end - 2]) | 32
+        if marker == ord('c') or marker == ord('d'):
+            if signed and marker == ord('d'):
+                sign = -1.0
+            end -= 2
+            while end > start and ord(s[end - 1]) <= 32:
+                end -= 1
+
+    if start < end and s[start] == '-':
+        sign = -sign
+        start += 1
+    elif start < end and s[start] == '+':
+        start += 1
+
+    # Accumulate digits as an exact integer and scale once at the end,
+    # so the result is the correctly rounded float for typical amounts
+    mantissa = 0
+    decimals = 0
+    digits = 0
+    seen_dot = False
+    for i in range(start, end):
+        c = ord(s[i])
+        if 48 <= c <= 57:
+            mantissa = mantissa * 10 + (c - 48)
+            digits += 1
+            if seen_dot:
+                decimals += 1
+        elif c == 46 and not seen_dot:
+            seen_dot = True
+        elif c != 44:
+            return np.nan
+
+    # More than 18 digits could overflow the integer mantissa when JIT-compiled
+    if digits == 0 or digits > 18:
+        return np.nan
+    return sign * mantissa / 10.0 ** decimals
@@ -1,7 +1,10 @@
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
 
+from compare import normalize
+
 def main():
     """Run a quick test of the ICICI parser"""
     print("=" * 70)
@@ -44,10 +47,9 @@ def main():
     print(f"Columns: {list(result_df.columns)}")
     
     # Normalize for comparison
-    result_normalized = result_df.fillna('').astype(str)
-    expected_normalized = expected_df.fillna('').astype(str)
+    columns_match = list(result_df.columns) == list(expected_df.columns)
     
-    if result_normalized.equals(expected_normalized):
+    if columns_match and np.array_equal(normalize(result_df), normalize(expected_df)):
         print("✅ Output matches expected CSV perfectly!")
     else:
         print("⚠️  Output differs from expected CSV")
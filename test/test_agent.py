@@ -0,0 +1,112 @@
+"""
+Test suite for the agent's generate/test routing
+"""
+import sys
+from pathlib import Path
+from types import SimpleNamespace
+import pytest
+
+# Add parent directory to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+agent = pytest.importorskip("agent")
+
+DUPLICATE_RESPONSE = "```python\ndef parse(pdf_path): pass\n```"
+
+
+class StubModel:
+    """Stand-in for the Gemini model that records every call"""
+
+    def __init__(self, text=DUPLICATE_RESPONSE, error=None):
+        self.text = text
+        self.error = error
+        self.prompts = []
+
+    def generate_content(self, prompt):
+        self.prompts.append(prompt)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(text=self.text)
+
+
+@pytest.fixture
+def stub_model(monkeypatch, tmp_path):
+    """Replace the model and isolate both cache layers"""
+    model = StubModel()
+    monkeypatch.setattr(agent, "model", model)
+    monkeypatch.setattr(agent, "CACHE_DIR", tmp_path)
+    monkeypatch.delenv("BANKPARSER_NO_CACHE", raising=False)
+    agent._cached_generate.cache_clear()
+    yield model
+    agent._cached_generate.cache_clear()
+
+
+def make_state(max_iterations=3):
+    return {
+        'target_bank': 'icici',
+        'pdf_analysis': '',
+        'pdf_full_context': '',
+        'last_prompt': '',
+        'generated_code': '',
+        'tried_hashes': set(),
+        'error_message': '',
+        'iteration': 1,
+        'max_iterations': max_iterations,
+        'status': 'generating',
+    }
+
+
+def test_duplicate_code_is_regenerated_without_cache(stub_model):
+    """Test that repeated code skips testing, still reaches the model, and ends at max_iterations"""
+    state = make_state(max_iterations=4)
+    
+    # First attempt is new code and goes to test
+    state = agent.generate_parser_code(state)
+    assert state['status'] == "testing"
+    assert agent.after_generate(state) == "test"
+    tested_code = state['generated_code']
+    
+    # The same code again is routed to retry with the duplicate note
+    state['error_message'] = "Test Failed"
+    state['iteration'] = 2
+    state = agent.generate_parser_code(state)
+    assert state['status'] == "fixing"
+    assert state['error_message'].endswith(agent.DUPLICATE_CODE_NOTE)
+    assert state['generated_code'] == tested_code
+    assert agent.after_generate(state) == "retry"
+    
+    # Further duplicates produce byte-identical prompts, which must still reach the model
+    for iteration in (3, 4):
+        state['iteration'] = iteration
+        state = agent.generate_parser_code(state)
+        assert state['status'] == "fixing"
+    assert len(stub_model.prompts) == 4
+    assert stub_model.prompts[2] == stub_model.prompts[3]
+    assert state['error_message'].count(agent.DUPLICATE_CODE_NOTE) == 1
+    
+    # At max_iterations the run ends instead of retrying
+    assert agent.after_generate(state) == "end"
+    assert state['status'] == "failed"
+
+
+def test_failed_responses_are_not_persisted(stub_model, tmp_path):
+    """Test that only responses whose parser passed are written to the disk cache"""
+    state = agent.generate_parser_code(make_state())
+    assert list(tmp_path.iterdir()) == []
+    
+    agent.save_cached_response(state['last_prompt'], state['generated_code'])
+    assert agent._cache_path(state['last_prompt']).read_text() == state['generated_code']
+
+
+def test_generation_error_ends_run(stub_model):
+    """Test that a code generation failure ends the run instead of testing stale code"""
+    stub_model.error = RuntimeError("quota exceeded")
+    
+    state = agent.generate_parser_code(make_state())
+    assert state['status'] == "failed"
+    assert "Code Generation Error" in state['error_message']
+    assert agent.after_generate(state) == "end"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -3,6 +3,7 @@ Test suite for generated bank statement parsers
 """
 import sys
 from pathlib import Path
+import numpy as np
 import pandas as pd
 import pytest
 
@@ -82,5 +83,49 @@ def test_icici_parser_row_count():
         f"Expected {len(expected_df)} rows, got {len(result_df)}"
 
 
+def test_icici_parser_pymupdf_matches_expected_output():
+    """Test that the PyMuPDF table backend produces the same output as the expected CSV"""
+    pytest.importorskip("fitz")
+    from custom_parser import icici_parser
+    from compare import normalize
+    
+    if not icici_parser._has_pymupdf_tables():
+        pytest.skip("installed PyMuPDF does not provide Page.find_tables")
+    
+    result_df = icici_parser.parse("data/icici/icici sample.pdf")
+    expected_df = pd.read_csv("data/icici/result.csv")
+    
+    assert list(result_df.columns) == list(expected_df.columns)
+    assert len(result_df) == len(expected_df), \
+        f"Row count mismatch: got {len(result_df)}, expected {len(expected_df)}"
+    assert np.array_equal(normalize(result_df), normalize(expected_df)), \
+        "PyMuPDF parser output does not match expected CSV"
+
+
+@pytest.mark.parametrize("raw, signed, expected", [
+    (None, False, np.nan),
+    ("", False, np.nan),
+    ("   ", False, np.nan),
+    ("1,935.30", False, 1935.3),
+    (" 6864.58 ", False, 6864.58),
+    ("500.00 Cr", True, 500.0),
+    ("500.00 Dr", True, -500.0),
+    ("500.00 Dr", False, 500.0),
+    ("-12.5", False, -12.5),
+    ("1.2.3", False, np.nan),
+    ("1e5", False, np.nan),
+    ("1" * 19, False, np.nan),
+])
+def test_icici_amount_parsing(raw, signed, expected):
+    """Test that raw amount cells are converted to floats (NaN when blank or invalid)"""
+    from custom_parser.icici_parser import _to_float
+    
+    result = _to_float(raw, signed)
+    if np.isnan(expected):
+        assert np.isnan(result), f"Expected NaN for {raw!r}, got {result}"
+    else:
+        assert result == expected, f"Expected {expected} for {raw!r}, got {result}"
+
+
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])